@@ -1,13 +1,19 @@
 import os
 import time
+import argparse
 import yt_dlp
-import whisper
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 from transformers import pipeline
 import warnings
 import re
 import math
+import glob
+import subprocess
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import soundfile as sf
+import torch
 
 warnings.filterwarnings("ignore")  # Suppress minor warnings for clarity
 
@@ -15,32 +21,118 @@ warnings.filterwarnings("ignore")  # Suppress minor warnings for clarity
 audio_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio")
 os.makedirs(audio_folder, exist_ok=True)
 
-# Helper Function: Retry mechanism
-def retry(func, max_attempts=3, wait_time=5, *args, **kwargs):
+# Patterns are compiled once at import instead of on every call
+_UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*：]')  # includes the full-width colon
+_YOUTUBE_URL_RE = re.compile(
+    r'(?:https?://)?(?:www\.)?'
+    r'(?:youtube\.com/watch\?v=|youtu\.be/)([A-Za-z0-9_-]{11})'
+)
+_SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])\s*')
+
+# Whisper works on 16 kHz mono audio
+WHISPER_SAMPLE_RATE = 16000
+
+# Allow TF32 matmuls for the transformers models on Ampere+ GPUs
+torch.set_float32_matmul_precision("high")
+
+# Models and the downloader are created once and reused across segments/calls
+_WHISPER = {}  # keyed by model name
+_CLEANER = None
+_YDL = None
+
+# distil-large-v3 matches medium's English accuracy at about twice the speed, but is English-only
+# and cannot translate, so everything else uses the multilingual medium model.
+# The language comes from --language rather than auto-detection: detecting it would need a
+# multilingual model loaded anyway, which costs more than distil-large-v3 saves on a single video.
+def whisper_model_name(language=None, task="transcribe"):
+    return "distil-large-v3" if language == "en" and task == "transcribe" else "medium"
+
+def get_whisper(model_name="medium"):
+    if model_name not in _WHISPER:
+        # CTranslate2 backend: same weights as openai-whisper, with fused kernels.
+        # Weights are quantized to int8 (about half the VRAM of FP16); activations stay FP16 on GPU.
+        if torch.cuda.is_available():
+            device, compute_type = "cuda", "int8_float16"
+        else:
+            device, compute_type = "cpu", "int8"
+        model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=os.cpu_count(),
+            num_workers=2,
+        )
+        # Batch the VAD-split ~30 s windows through one GPU forward instead of decoding them one by one
+        _WHISPER[model_name] = BatchedInferencePipeline(model=model)
+    return _WHISPER[model_name]
+
+def get_cleaner():
+    global _CLEANER
+    if _CLEANER is None:
+        device = 0 if torch.cuda.is_available() else -1  # GPU if present, same fallback as get_whisper()
+        _CLEANER = pipeline("text2text-generation", model="t5-small", device=device)
+    return _CLEANER
+
+def get_ydl():
+    global _YDL
+    if _YDL is None:
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            # Keep the native container for the download; only the extract step below writes WAV
+            'outtmpl': os.path.join(audio_folder, 'audio.%(ext)s'),  # Use a fixed filename
+            'overwrites': True,  # The fixed filename is reused by every download
+            'concurrent_fragment_downloads': 8,  # Fetch HLS/DASH fragments in parallel
+            'http_chunk_size': 10 * 1024 * 1024,  # Ranged requests avoid YouTube's per-connection throttling
+            'postprocessors': [{
+                # soundfile (quality check, splitting) needs PCM, so decode exactly once to WAV
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'wav',
+            }],
+            # Resample once here so every later stage works on small 16 kHz mono files
+            'postprocessor_args': {
+                'extractaudio': ['-ar', str(WHISPER_SAMPLE_RATE), '-ac', '1'],
+            },
+        }
+        _YDL = yt_dlp.YoutubeDL(ydl_opts)
+    return _YDL
+
+# Errors worth retrying: network hiccups, not deterministic failures
+TRANSIENT_ERRORS = (yt_dlp.utils.DownloadError, urllib.error.URLError, ConnectionError, TimeoutError)
+
+# Helper Function: Retry mechanism with exponential backoff (wait_time doubles after each failure).
+# before_last_attempt, if given, is called once right before the final attempt.
+def retry(func, max_attempts=3, wait_time=1, *args, before_last_attempt=None, **kwargs):
     attempt = 0
     while attempt < max_attempts:
         try:
             return func(*args, **kwargs)
-        except Exception as e:
+        except TRANSIENT_ERRORS as e:
             print(f"Attempt {attempt + 1} failed: {e}")
             attempt += 1
             if attempt < max_attempts:
                 print(f"Retrying in {wait_time} seconds...")
                 time.sleep(wait_time)
+                wait_time *= 2
+                if attempt == max_attempts - 1 and before_last_attempt is not None:
+                    before_last_attempt()
             else:
                 print("All attempts failed.")
                 return None
 
 # Helper Function: Sanitize filename by removing/replacing special characters
 def sanitize_filename(filename):
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)  # removes problematic characters
-    filename = filename.replace("：", "")  # specifically remove the full-width colon
-    return filename
+    return _UNSAFE_FILENAME_RE.sub('', filename)  # removes problematic characters
 
 # Helper Function: Check audio quality (basic volume threshold)
 def check_audio_quality(audio_path, threshold=0.01):
-    data, _ = sf.read(audio_path)
-    volume = np.sqrt(np.mean(data**2))
+    # Stream the file in blocks and accumulate the sum of squares instead of loading it whole
+    sum_squares = 0.0
+    num_samples = 0
+    for block in sf.blocks(audio_path, blocksize=65536, dtype="float32", always_2d=False):
+        flat = block.reshape(-1)
+        sum_squares += float(np.dot(flat, flat))  # BLAS sdot, no data**2 temporary
+        num_samples += flat.size
+    volume = math.sqrt(sum_squares / num_samples) if num_samples else 0.0
     if volume < threshold:
         print("Warning: Audio quality appears low. This may impact transcription accuracy.")
     else:
@@ -48,129 +140,240 @@ def check_audio_quality(audio_path, threshold=0.01):
 
 # Helper Function: Validate YouTube URL
 def is_valid_youtube_url(url):
-    youtube_regex = (
-        r'(https?://)?(www\.)?'
-        '(youtube\.com/watch\?v=|youtu\.be/)([a-zA-Z0-9_-]{11})'
-    )
-    return re.match(youtube_regex, url) is not None
+    return _YOUTUBE_URL_RE.match(url) is not None
 
 # Step 1: Download audio from YouTube with sanitized filename
 def download_audio(youtube_url):
     try:
         print("Downloading audio from YouTube...")
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': os.path.join(audio_folder, 'audio.wav'),  # Use a fixed filename
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-                'preferredquality': '192',
-            }],
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(youtube_url, download=True)
-            print("Audio downloaded and saved as:", os.path.join(audio_folder, 'audio.wav'))
-            return os.path.join(audio_folder, 'audio.wav'), info['id']
+        ydl = get_ydl()
+        info = ydl.extract_info(youtube_url, download=True)
+        print("Audio downloaded and saved as:", os.path.join(audio_folder, 'audio.wav'))
+        return os.path.join(audio_folder, 'audio.wav'), info['id']
+    except TRANSIENT_ERRORS:
+        raise  # Let retry() back off and try again
     except Exception as e:
         print(f"Error downloading audio: {e}")
         return None, None
 
+# Stale cached extractor data can cause repeat failures; used as a last resort before the final retry
+# since the cache directory is shared with the yt-dlp CLI
+def clear_ydl_cache():
+    try:
+        get_ydl().cache.remove()
+    except Exception as e:  # yt-dlp raises a bare Exception if the directory doesn't look like its cache
+        print(f"Could not clear yt-dlp cache: {e}")
+
 # Step 2: Check audio duration and optionally split if too long
+# Yields segment paths as soon as each one is fully written, so transcription can start early
 def split_long_audio(audio_path, max_duration=600):
-    data, sample_rate = sf.read(audio_path)
-    duration = len(data) / sample_rate
-    if duration > max_duration:
-        print(f"Warning: Audio duration ({duration / 60:.2f} minutes) exceeds {max_duration / 60} minutes.")
-        print("Splitting into smaller segments for processing...")
-        segments = []
-        num_segments = math.ceil(duration / max_duration)
-        for i in range(num_segments):
-            start = int(i * max_duration * sample_rate)
-            end = int((i + 1) * max_duration * sample_rate)
-            segment_path = f"{audio_path}_segment_{i + 1}.wav"
-            sf.write(segment_path, data[start:end], sample_rate)
-            segments.append(segment_path)
-        return segments
-    else:
-        return [audio_path]
+    duration = sf.info(audio_path).duration  # Parses the header only
+    if duration <= max_duration:
+        yield audio_path
+        return
+    print(f"Warning: Audio duration ({duration / 60:.2f} minutes) exceeds {max_duration / 60} minutes.")
+    print("Splitting into smaller segments for processing...")
+    # Drop segments left over from a previous run
+    for old_segment in glob.glob(f"{audio_path}_segment_*.wav"):
+        os.remove(old_segment)
+    # Let ffmpeg's segment muxer copy byte ranges instead of decoding and re-writing in Python.
+    # The segment list is written to stdout one line per segment, when that segment is closed.
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+            "-i", audio_path,
+            "-f", "segment",
+            "-segment_time", str(max_duration),
+            "-segment_list", "pipe:1",
+            "-segment_list_type", "flat",
+            "-c", "copy",
+            f"{audio_path}_segment_%03d.wav",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    segment_dir = os.path.dirname(audio_path)
+    try:
+        for line in process.stdout:
+            yield os.path.join(segment_dir, os.path.basename(line.strip()))
+    finally:
+        # Consumer stopped early (e.g. transcription error): don't leave ffmpeg running
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
 
-# Step 3: Transcribe audio with Whisper and show estimated time
-def transcribe_audio_with_eta(audio_path):
+# Step 3: Transcribe audio with faster-whisper and show estimated time
+# task="translate" makes Whisper output English text directly, whatever the spoken language
+def transcribe_audio_with_eta(audio_path, language=None, task="transcribe"):
     print("Transcribing audio... This may take a few minutes.")
-    model = whisper.load_model("medium").to("cuda")  # Ensure GPU usage
+    model = get_whisper(whisper_model_name(language, task))
     start_time = time.time()
-    # Transcribe
-    result = model.transcribe(audio_path)
+    # Downloads are already 16 kHz mono, so pass the samples and skip Whisper's own ffmpeg decode/resample
+    info = sf.info(audio_path)
+    if info.samplerate == WHISPER_SAMPLE_RATE and info.channels == 1:
+        audio, _ = sf.read(audio_path, dtype="float32")
+    else:
+        audio = audio_path
+    # Transcribe (segments is a lazy generator, decoding happens while joining)
+    segments, _ = model.transcribe(audio, language=language, task=task, beam_size=5, vad_filter=True, batch_size=16)
+    text = "".join(segment.text for segment in segments)
     end_time = time.time()
     actual_time = end_time - start_time
     print(f"Transcription completed in {round(actual_time, 2)} seconds.")
-    return result["text"]
+    return text
 
 # Step 4: Clean text
+# Group sentences into chunks that fit T5's 512-token input (prompt prefix included)
+def split_into_chunks(text, tokenizer, max_tokens=400):
+    chunks = []
+    current, current_tokens = [], 0
+    for sentence in _SENTENCE_BREAK_RE.split(text.strip()):
+        if not sentence:
+            continue
+        tokens = tokenizer.tokenize(sentence)
+        if len(tokens) <= max_tokens:
+            pieces = [(sentence, len(tokens))]
+        else:
+            # Unpunctuated text can be one huge "sentence"; cut it into windows so nothing is truncated
+            windows = [tokens[start:start + max_tokens] for start in range(0, len(tokens), max_tokens)]
+            pieces = [(tokenizer.convert_tokens_to_string(window), len(window)) for window in windows]
+        for piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
 def clean_text(text):
     try:
         print("Cleaning up the transcript text...")
-        cleaner = pipeline("text2text-generation", model="t5-small", device=0)  # Specify device for GPU usage
-        clean_text = cleaner(f"Fix grammar and punctuation: {text}", max_length=500)
+        cleaner = get_cleaner()
+        chunks = split_into_chunks(text, cleaner.tokenizer)
+        if not chunks:
+            return text
+        # Clean every chunk in batches instead of truncating the whole transcript to one input
+        results = cleaner(
+            [f"Fix grammar and punctuation: {chunk}" for chunk in chunks],
+            batch_size=16,
+            max_new_tokens=400,
+            truncation=True,
+        )
         print("Text cleaning completed!")
-        return clean_text[0]['generated_text']
+        return " ".join(result['generated_text'] for result in results)
     except Exception as e:
         print(f"Error cleaning text: {e}")
         return text
 
 # Main function to process YouTube video
-def process_youtube_video(youtube_url):
+def process_youtube_video(youtube_url, interactive=False, language=None, translate=False):
     start_time = time.time()
     # Step 1: Validate YouTube URL
     if not is_valid_youtube_url(youtube_url):
         print("Error: Invalid YouTube URL. Please provide a valid link.")
         return
     # Step 2: Download audio
-    audio_file, video_id = retry(download_audio, 3, 5, youtube_url)
+    audio_file, video_id = retry(download_audio, 3, 1, youtube_url,
+                                    before_last_attempt=clear_ydl_cache) or (None, None)
     if audio_file is None:
         print("Exiting process due to download error.")
         return
-    # Wait for user confirmation to proceed to next step
-    input("Audio downloaded successfully. Press Enter to proceed to audio quality check...")
-    # Step 3: Check audio quality and duration
-    check_audio_quality(audio_file)
-    audio_segments = split_long_audio(audio_file)
-    # Wait for user confirmation to proceed to transcription
-    input("Audio quality checked. Press Enter to proceed to transcription...")
-    # Step 4: Transcribe each audio segment
-    full_transcript = ""
-    for segment in audio_segments:
-        transcript = retry(transcribe_audio_with_eta, 3, 5, segment)
-        if transcript is None:
+    if interactive:
+        # Wait for user confirmation to proceed to next step
+        input("Audio downloaded successfully. Press Enter to proceed to audio quality check...")
+    # The download itself can't overlap with later stages: everything below needs the extracted WAV.
+    # What does overlap is the quality check, the ffmpeg split and transcription.
+    # Step 3: Check audio quality in the background; it only reads the file
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        quality_check = executor.submit(check_audio_quality, audio_file)
+        if interactive:
+            # Wait for user confirmation to proceed to transcription
+            quality_check.result()
+            input("Audio quality checked. Press Enter to proceed to transcription...")
+        # Step 4: Transcribe each audio segment as soon as ffmpeg has written it.
+        # Each transcript is appended to transcript.txt on a writer thread while the next segment is transcribed.
+        transcript_file = os.path.join(audio_folder, 'transcript.txt')
+        transcripts = []
+        pending_writes = []
+        transcription_failed = False
+        try:
+            transcript_out = open(transcript_file, "w", encoding="utf-8", buffering=1 << 20)
+        except OSError as e:
+            # Saving is best effort: keep transcribing and still clean the in-memory transcript
+            print(f"Error saving transcript file: {e}")
+            transcript_out = None
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            # split_long_audio is a generator, so ffmpeg errors (or a missing ffmpeg) surface in the loop itself
+            try:
+                for segment in split_long_audio(audio_file):
+                    # Not retried: a failed transcription fails the same way again
+                    try:
+                        transcript = transcribe_audio_with_eta(segment, language, "translate" if translate else "transcribe")
+                    except Exception as e:
+                        print(f"Error transcribing audio: {e}")
+                        transcription_failed = True
+                        break
+                    transcripts.append(transcript)
+                    if transcript_out is not None:
+                        pending_writes.append(writer.submit(transcript_out.write, transcript + "\n"))
+            except Exception as e:
+                print(f"Error splitting audio: {e}")
+                transcription_failed = True
+        if transcript_out is not None:
+            try:
+                for write in pending_writes:
+                    write.result()
+                transcript_out.close()  # Final flush; can fail e.g. on a full disk
+                print(f"Transcript saved as '{transcript_file}'")
+            except Exception as e:
+                print(f"Error saving transcript file: {e}")
+                try:
+                    transcript_out.close()  # Still-buffered data fails to flush again; just release the file
+                except OSError:
+                    pass
+        if transcription_failed:
             print("Exiting process due to transcription error.")
             return
-        full_transcript += transcript + "\n"
-    # Wait for user confirmation to proceed to text cleaning
-    input("Transcription completed. Press Enter to proceed to text cleaning...")
-    # Step 5: Clean transcript text
-    cleaned_text = retry(clean_text, 3, 5, full_transcript)
-    # Save the cleaned transcript
-    try:
-        transcript_file = os.path.join(audio_folder, 'transcript.txt')
-        with open(transcript_file, "w", encoding="utf-8") as f:
-            f.write(full_transcript)
-        print(f"Transcript saved as '{transcript_file}'")
-    except Exception as e:
-        print(f"Error saving transcript file: {e}")
+        quality_check.result()
+    full_transcript = "".join(transcript + "\n" for transcript in transcripts)
+    # Whisper's translate task already emits punctuated English, so the T5 pass is only
+    # worth running for same-language transcripts
+    if not translate:
+        if interactive:
+            # Wait for user confirmation to proceed to text cleaning
+            input("Transcription completed. Press Enter to proceed to text cleaning...")
+        # Step 5: Clean transcript text
+        cleaned_text = clean_text(full_transcript)  # Logs and falls back to the raw text on failure
 
-    # Save cleaned transcript
-    try:
-        cleaned_transcript_file = os.path.join(audio_folder, 'cleaned_transcript.txt')
-        with open(cleaned_transcript_file, "w", encoding="utf-8") as f:
-            f.write(cleaned_text)
-        print(f"Cleaned transcript saved as '{cleaned_transcript_file}'")
-    except Exception as e:
-        print(f"Error saving cleaned transcript file: {e}")
+        # Save cleaned transcript
+        try:
+            cleaned_transcript_file = os.path.join(audio_folder, 'cleaned_transcript.txt')
+            with open(cleaned_transcript_file, "w", encoding="utf-8") as f:
+                f.write(cleaned_text)
+            print(f"Cleaned transcript saved as '{cleaned_transcript_file}'")
+        except Exception as e:
+            print(f"Error saving cleaned transcript file: {e}")
 
     # Display total time taken
     end_time = time.time()
     print(f"Total time taken: {round(end_time - start_time, 2)} seconds")
 
-# Example usage:
-youtube_url = input("Enter the YouTube URL: ")
-process_youtube_video(youtube_url)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download a YouTube video's audio and transcribe it.")
+    parser.add_argument("url", nargs="?", help="YouTube URL (prompted for if omitted)")
+    parser.add_argument("--step", action="store_true",
+                        help="pause for confirmation between stages (disables stage overlap)")
+    parser.add_argument("--language",
+                        help="spoken language code, e.g. 'en' or 'tr' (auto-detected if omitted; "
+                             "'en' uses the faster distil-large-v3 model)")
+    parser.add_argument("--translate", action="store_true",
+                        help="translate the speech to English instead of transcribing it "
+                             "(skips the T5 cleanup step)")
+    args = parser.parse_args()
+    youtube_url = args.url or input("Enter the YouTube URL: ")
+    process_youtube_video(youtube_url, interactive=args.step, language=args.language,
+                          translate=args.translate)